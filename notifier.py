@@ -5,16 +5,18 @@ Uses Playwright headless browser to scrape public Facebook page posts.
 Sends push notifications via ntfy for new posts.
 """
 
-import json
 import os
 import sys
 import logging
+import mmap
 import re
 import asyncio
 import time
 from pathlib import Path
 from typing import Optional
 
+import httpx
+import orjson
 import requests
 
 # Configure logging
@@ -39,8 +41,7 @@ class Config:
                 "Copy config.example.json to config.json and fill in your values."
             )
 
-        with open(self.config_path) as f:
-            data = json.load(f)
+        data = orjson.loads(self.config_path.read_bytes())
 
         self.facebook_page = data.get("facebook_page", "newarkparkrun")
         self.instagram_page = data.get("instagram_page")
@@ -52,49 +53,111 @@ class Config:
 
 
 class SeenPosts:
-    """Track posts we've already processed to avoid duplicate notifications."""
+    """Track posts we've already processed to avoid duplicate notifications.
+
+    IDs are stored one per line so that saving only appends the posts seen
+    since the last save. Files in the old ``{"seen_ids": [...]}`` JSON format
+    are converted on load.
+    """
 
     def __init__(self, filepath: Path):
         self.filepath = filepath
         self.seen: set[str] = set()
+        self._unsaved: list[str] = []
+        self._needs_rewrite = False
         self._load()
 
     def _load(self):
-        if self.filepath.exists():
-            with open(self.filepath) as f:
-                data = json.load(f)
-                self.seen = set(data.get("seen_ids", []))
+        if not self.filepath.exists() or self.filepath.stat().st_size == 0:
+            return
+
+        # One contiguous read and decode, then a C-level splitlines(); this is
+        # cheaper than tokenising JSON or decoding line by line.
+        with open(self.filepath, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm.read()
+
+        legacy = data[:64].lstrip().startswith(b'{')
+        if legacy:
+            self.seen = set(orjson.loads(data).get("seen_ids", []))
+        else:
+            self.seen = set(data.decode().splitlines())
+            self.seen.discard('')
+
+        if legacy:
+            self._needs_rewrite = True
+            try:
+                self._rewrite()
+            except OSError as e:
+                logger.warning(f"Could not convert {self.filepath}, will retry on save: {e}")
+
+    def _write_ids(self, path: Path):
+        with open(path, 'w') as f:
+            f.writelines(f"{post_id}\n" for post_id in self.seen)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self):
+        # Write beside the original and swap it in, so a crash mid-write
+        # can't leave a truncated file behind to be synced back to GCS.
+        tmp_path = self.filepath.with_name(self.filepath.name + '.tmp')
+        self._write_ids(tmp_path)
+        try:
+            os.replace(tmp_path, self.filepath)
+        except OSError:
+            # A single-file bind mount (docker-compose) can't be renamed over
+            os.unlink(tmp_path)
+            self._write_ids(self.filepath)
+        self._needs_rewrite = False
 
     def save(self):
-        with open(self.filepath, 'w') as f:
-            json.dump({"seen_ids": list(self.seen)}, f, indent=2)
+        if self._needs_rewrite:
+            self._rewrite()
+            self._unsaved.clear()
+            return
+        if not self._unsaved:
+            return
+        with open(self.filepath, 'a') as f:
+            f.writelines(f"{post_id}\n" for post_id in self._unsaved)
+            f.flush()
+            os.fsync(f.fileno())
+        self._unsaved.clear()
 
     def is_seen(self, post_id: str) -> bool:
         return post_id in self.seen
 
     def mark_seen(self, post_id: str):
-        self.seen.add(post_id)
+        if post_id not in self.seen:
+            self.seen.add(post_id)
+            self._unsaved.append(post_id)
+
+
+_IG_SHORTCODE_RE = re.compile(r'/p/([A-Za-z0-9_-]{9,})/')
+_FB_PFBID_RE = re.compile(r'/posts/(pfbid\w+)')
+_FB_NUMERIC_POST_RE = re.compile(r'/posts/(\d+)')
+_FB_STORY_FBID_RE = re.compile(r'story_fbid=(\d+)')
+_FB_PAGE_ID_RE = re.compile(r'[?&]id=(\d+)')
 
 
 def generate_post_id(post_url: str, text: str) -> Optional[str]:
     """Extract a stable post ID from a Facebook or Instagram URL."""
     # Instagram shortcode: /p/<shortcode>/
-    match = re.search(r'/p/([A-Za-z0-9_-]{9,})/', post_url)
+    match = _IG_SHORTCODE_RE.search(post_url)
     if match:
         return f"ig_{match.group(1)}"
 
     # Facebook pfbid format
-    match = re.search(r'/posts/(pfbid\w+)', post_url)
+    match = _FB_PFBID_RE.search(post_url)
     if match:
         return match.group(1)
 
     # Facebook numeric post ID
-    match = re.search(r'/posts/(\d+)', post_url)
+    match = _FB_NUMERIC_POST_RE.search(post_url)
     if match:
         return match.group(1)
 
     # Facebook story.php
-    match = re.search(r'story_fbid=(\d+)', post_url)
+    match = _FB_STORY_FBID_RE.search(post_url)
     if match:
         return f"story_{match.group(1)}"
 
@@ -102,24 +165,31 @@ def generate_post_id(post_url: str, text: str) -> Optional[str]:
     return None
 
 
+_HEADER_TRANSLATION = str.maketrans({
+    '\u2019': "'",
+    '\u2018': "'",
+    '\u201c': '"',
+    '\u201d': '"',
+    '\u2013': '-',
+    '\u2014': '--',
+    '\u2026': '...',
+})
+
+
 def sanitize_for_header(text: str) -> str:
     """Sanitize text for use in HTTP headers (ASCII only)."""
-    replacements = {
-        '\u2019': "'",
-        '\u2018': "'",
-        '\u201c': '"',
-        '\u201d': '"',
-        '\u2013': '-',
-        '\u2014': '--',
-        '\u2026': '...',
-    }
-    for unicode_char, ascii_char in replacements.items():
-        text = text.replace(unicode_char, ascii_char)
+    return text.translate(_HEADER_TRANSLATION).encode('ascii', 'ignore').decode('ascii')
 
-    return text.encode('ascii', 'ignore').decode('ascii')
 
+def _build_ntfy_client() -> httpx.AsyncClient:
+    """Build a client so notifications in one check share a keep-alive connection."""
+    return httpx.AsyncClient(
+        headers={"Tags": "running,facebook,parkrun"},
+        timeout=10,
+    )
 
-def send_ntfy_notification(config: Config, title: str, message: str, url: Optional[str] = None, image_url: Optional[str] = None):
+
+async def send_ntfy_notification(client: httpx.AsyncClient, config: Config, title: str, message: str, url: Optional[str] = None, image_url: Optional[str] = None):
     """Send a push notification via ntfy."""
     ntfy_url = f"{config.ntfy_server}/{config.ntfy_topic}"
 
@@ -127,7 +197,6 @@ def send_ntfy_notification(config: Config, title: str, message: str, url: Option
 
     headers = {
         "Title": safe_title,
-        "Tags": "running,facebook,parkrun",
     }
 
     if url:
@@ -137,11 +206,10 @@ def send_ntfy_notification(config: Config, title: str, message: str, url: Option
         headers["Attach"] = image_url
 
     try:
-        response = requests.post(
+        response = await client.post(
             ntfy_url,
-            data=message[:4096].encode('utf-8'),
+            content=message[:4096].encode('utf-8'),
             headers=headers,
-            timeout=10
         )
         response.raise_for_status()
         logger.info(f"Notification sent: {safe_title}")
@@ -160,8 +228,7 @@ def load_cookies(cookies_path: Path) -> list[dict]:
     if not cookies_path.exists():
         logger.info(f"No cookies file at {cookies_path} — proceeding unauthenticated")
         return []
-    with open(cookies_path) as f:
-        cookies = json.load(f)
+    cookies = orjson.loads(cookies_path.read_bytes())
 
     # Playwright requires sameSite to be "Strict", "Lax", or "None" (capitalised).
     # Browser export tools use "no_restriction", "lax", "strict", or null.
@@ -192,16 +259,19 @@ _MOBILE_UA = (
 
 def _extract_posts_from_html(html: str, page_name: str) -> list[dict]:
     """Parse mbasic Facebook HTML and return post dicts."""
-    from bs4 import BeautifulSoup
+    from selectolax.lexbor import LexborHTMLParser
 
-    soup = BeautifulSoup(html, 'html.parser')
+    tree = LexborHTMLParser(html)
+    # get_text() in BeautifulSoup skipped these; selectolax's text() doesn't
+    tree.strip_tags(['script', 'style', 'template'])
     unique_posts: dict[str, dict] = {}
+    page_post_re = re.compile(rf'/{re.escape(page_name)}/posts/(\d+)')
 
-    for a in soup.find_all('a', href=True):
-        href = a['href']
+    for a in tree.css('a[href]'):
+        href = a.attributes.get('href') or ''
 
         # pfbid format
-        m = re.search(r'/posts/(pfbid\w+)', href)
+        m = _FB_PFBID_RE.search(href)
         if m:
             pid = m.group(1)
             if pid not in unique_posts:
@@ -212,7 +282,7 @@ def _extract_posts_from_html(html: str, page_name: str) -> list[dict]:
             continue
 
         # Numeric post path
-        m = re.search(rf'/{re.escape(page_name)}/posts/(\d+)', href)
+        m = page_post_re.search(href)
         if m:
             pid = m.group(1)
             if pid not in unique_posts:
@@ -223,10 +293,10 @@ def _extract_posts_from_html(html: str, page_name: str) -> list[dict]:
             continue
 
         # story.php format
-        m = re.search(r'story_fbid=(\d+)', href)
+        m = _FB_STORY_FBID_RE.search(href)
         if m:
             pid = f"story_{m.group(1)}"
-            page_id_m = re.search(r'[?&]id=(\d+)', href)
+            page_id_m = _FB_PAGE_ID_RE.search(href)
             if pid not in unique_posts:
                 if page_id_m:
                     post_url = (
@@ -242,20 +312,24 @@ def _extract_posts_from_html(html: str, page_name: str) -> list[dict]:
     posts = []
     for pid, info in list(unique_posts.items())[:10]:
         anchor = info['anchor']
-        # Walk up to the nearest block-level container with some substance
+        # Walk up to the nearest block-level container with some substance.
+        # The final container's text is kept rather than re-extracted below;
+        # the separator is one character either way so the length test holds.
         container = anchor
+        text = None
         for _ in range(5):
             parent = container.parent
             if parent is None:
                 break
             container = parent
-            text = container.get_text(separator=' ', strip=True)
+            text = container.text(separator='\n', strip=True, skip_empty=True)
             if len(text) > 50:
                 break
 
-        text = container.get_text(separator='\n', strip=True)
-        img = container.find('img')
-        image_url = img['src'] if img and img.get('src') else None
+        if text is None:
+            text = container.text(separator='\n', strip=True, skip_empty=True)
+        img = container.css_first('img')
+        image_url = (img.attributes.get('src') or None) if img else None
 
         logger.info(f"Post {pid[:20]}: {text[:60]}...")
         posts.append({
@@ -296,6 +370,19 @@ def scrape_with_requests(page_name: str, cookies: list[dict]) -> list[dict]:
     return _extract_posts_from_html(resp.text, page_name)
 
 
+# Only the DOM is read, so skip downloading and decoding anything that is
+# purely presentational. <img src> attributes are still present in the DOM.
+_BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font', 'stylesheet'})
+
+
+async def _block_heavy_resources(route):
+    """Playwright route handler that aborts requests for non-DOM resources."""
+    if route.request.resource_type in _BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
 async def scrape_with_playwright(page_name: str, cookies: list[dict]) -> list[dict]:
     """Fallback: use Playwright headless browser against mbasic.facebook.com."""
     from playwright.async_api import async_playwright
@@ -307,13 +394,14 @@ async def scrape_with_playwright(page_name: str, cookies: list[dict]) -> list[di
     async with async_playwright() as p:
         browser = await p.chromium.launch(
             headless=True,
-            args=['--disable-blink-features=AutomationControlled'],
+            args=['--disable-blink-features=AutomationControlled', '--disable-gpu'],
         )
         context = await browser.new_context(
             viewport={'width': 390, 'height': 844},
             locale='en-US',
             user_agent=_MOBILE_UA,
         )
+        await context.route('**/*', _block_heavy_resources)
         if cookies:
             await context.add_cookies(cookies)
 
@@ -339,14 +427,14 @@ async def scrape_with_playwright(page_name: str, cookies: list[dict]) -> list[di
     return posts
 
 
-def scrape_facebook_page(page_name: str, cookies: list[dict]) -> list[dict]:
+async def scrape_facebook_page(page_name: str, cookies: list[dict]) -> list[dict]:
     """Try plain HTTP first; fall back to Playwright if blocked."""
-    posts = scrape_with_requests(page_name, cookies)
+    posts = await asyncio.to_thread(scrape_with_requests, page_name, cookies)
     if posts:
         return posts
 
     logger.info("Plain HTTP returned no posts, falling back to Playwright")
-    return asyncio.run(scrape_with_playwright(page_name, cookies))
+    return await scrape_with_playwright(page_name, cookies)
 
 
 def _build_instagram_session(cookies: list[dict]) -> requests.Session:
@@ -418,7 +506,7 @@ async def _scrape_instagram_playwright(username: str, cookies: list[dict]) -> li
     async with async_playwright() as p:
         browser = await p.chromium.launch(
             headless=True,
-            args=['--disable-blink-features=AutomationControlled'],
+            args=['--disable-blink-features=AutomationControlled', '--disable-gpu'],
         )
         context = await browser.new_context(
             viewport={'width': 1280, 'height': 800},
@@ -429,6 +517,7 @@ async def _scrape_instagram_playwright(username: str, cookies: list[dict]) -> li
                 'Chrome/125.0.0.0 Safari/537.36'
             ),
         )
+        await context.route('**/*', _block_heavy_resources)
 
         if cookies:
             pw_cookies = []
@@ -496,7 +585,7 @@ async def _scrape_instagram_playwright(username: str, cookies: list[dict]) -> li
     return posts
 
 
-def scrape_instagram(username: str, cookies: list[dict]) -> list[dict]:
+async def scrape_instagram(username: str, cookies: list[dict]) -> list[dict]:
     """Fetch recent posts from an Instagram profile.
 
     Tries the internal web_profile_info JSON API first (fast, has captions).
@@ -511,7 +600,7 @@ def scrape_instagram(username: str, cookies: list[dict]) -> list[dict]:
     api_url = f"https://i.instagram.com/api/v1/users/web_profile_info/?username={username}"
     logger.info(f"Trying Instagram API: {api_url}")
     try:
-        resp = session.get(api_url, timeout=15)
+        resp = await asyncio.to_thread(session.get, api_url, timeout=15)
         logger.info(f"Instagram API response: {resp.status_code}")
         if resp.status_code == 200:
             data = resp.json()
@@ -523,16 +612,21 @@ def scrape_instagram(username: str, cookies: list[dict]) -> list[dict]:
         logger.warning(f"Instagram API request failed: {e} — falling back to Playwright")
 
     # Fallback: Playwright rendering of www.instagram.com
-    return asyncio.run(_scrape_instagram_playwright(username, cookies))
+    return await _scrape_instagram_playwright(username, cookies)
+
 
+async def process_page(config: Config, seen_posts: SeenPosts):
+    """Scrape the configured source (Instagram or Facebook) and send notifications.
 
-def process_page(config: Config, seen_posts: SeenPosts):
-    """Scrape the configured source (Instagram or Facebook) and send notifications."""
+    This is a coroutine so that a long-running caller can drive repeated
+    checks from one event loop rather than creating a new one each time.
+    Blocking HTTP requests are run in a worker thread to keep that loop free.
+    """
     if config.instagram_page:
         logger.info(f"Checking Instagram page: {config.instagram_page}")
         ig_cookies = load_cookies(config.instagram_cookies_file)
         try:
-            posts = scrape_instagram(config.instagram_page, ig_cookies)
+            posts = await scrape_instagram(config.instagram_page, ig_cookies)
         except Exception as e:
             logger.error(f"Failed to scrape Instagram page: {e}")
             raise
@@ -540,7 +634,7 @@ def process_page(config: Config, seen_posts: SeenPosts):
         logger.info(f"Checking Facebook page: {config.facebook_page}")
         cookies = load_cookies(config.cookies_file)
         try:
-            posts = scrape_facebook_page(config.facebook_page, cookies)
+            posts = await scrape_facebook_page(config.facebook_page, cookies)
         except Exception as e:
             logger.error(f"Failed to scrape Facebook page: {e}")
             raise
@@ -550,39 +644,49 @@ def process_page(config: Config, seen_posts: SeenPosts):
         return
 
     logger.info(f"Found {len(posts)} posts to check")
-    new_posts = 0
+    new_posts: dict[str, dict] = {}
 
     for post in reversed(posts):
-        post_id = generate_post_id(post['post_url'], post['text'])
+        post_url = post['post_url']
+        text = post['text']
+        post_id = generate_post_id(post_url, text)
 
         if post_id is None:
-            logger.debug(f"Skipping post without valid ID: {post['post_url'][:50]}...")
+            logger.debug(f"Skipping post without valid ID: {post_url[:50]}...")
             continue
 
-        if seen_posts.is_seen(post_id):
+        if seen_posts.is_seen(post_id) or post_id in new_posts:
             logger.debug(f"Already seen post: {post_id}")
             continue
 
         # For Instagram we may have no caption — still notify, just with the URL
-        first_line = post['text'].split('\n')[0][:50] if post['text'] else 'New post'
+        first_line = text.partition('\n')[0][:50] if text else 'New post'
         title = f"Newark Parkrun: {first_line}"
-        message = post['text'][:500] + ("..." if len(post['text']) > 500 else "") if post['text'] else post['post_url']
-
-        logger.info(f"New post found: {post['post_url']}")
+        message = text[:500] + ("..." if len(text) > 500 else "") if text else post_url
 
-        send_ntfy_notification(
-            config,
-            title=title,
-            message=message,
-            url=post['post_url'],
-            image_url=post.get('image_url'),
-        )
+        logger.info(f"New post found: {post_url}")
 
-        seen_posts.mark_seen(post_id)
-        new_posts += 1
+        new_posts[post_id] = {
+            'title': title,
+            'message': message,
+            'url': post_url,
+            'image_url': post.get('image_url'),
+        }
 
-    seen_posts.save()
-    logger.info(f"Processed {new_posts} new posts")
+    # Send one at a time so ntfy delivers posts oldest-first. Posts are only
+    # marked as seen once their notification has gone out; on failure the
+    # rest are left for the next check so the order is kept.
+    sent = 0
+    try:
+        if new_posts:
+            async with _build_ntfy_client() as client:
+                for post_id, notification in new_posts.items():
+                    await send_ntfy_notification(client, config, **notification)
+                    seen_posts.mark_seen(post_id)
+                    sent += 1
+    finally:
+        seen_posts.save()
+        logger.info(f"Processed {sent} new posts")
 
 
 def main():
@@ -599,19 +703,25 @@ def main():
 
     if run_once:
         try:
-            process_page(config, seen_posts)
+            asyncio.run(process_page(config, seen_posts))
         except Exception as e:
             logger.exception(f"Unexpected error: {e}")
         return
 
-    while True:
-        try:
-            process_page(config, seen_posts)
-        except Exception as e:
-            logger.exception(f"Unexpected error: {e}")
-
-        logger.info("Sleeping 30 minutes until next check...")
-        time.sleep(30 * 60)
+    # Reuse one event loop for every check instead of building a new one
+    # (and tearing it down again) every 30 minutes.
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                loop.run_until_complete(process_page(config, seen_posts))
+            except Exception as e:
+                logger.exception(f"Unexpected error: {e}")
+
+            logger.info("Sleeping 30 minutes until next check...")
+            time.sleep(30 * 60)
+    finally:
+        loop.close()
 
 
 if __name__ == "__main__":
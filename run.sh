@@ -7,7 +7,7 @@ echo "Downloading config from GCS..."
 gsutil cp ${BUCKET}/config.json /app/config.json
 
 echo "Downloading seen_posts from GCS (if exists)..."
-gsutil cp ${BUCKET}/seen_posts.json /app/seen_posts.json 2>/dev/null || echo '{"seen_ids":[]}' > /app/seen_posts.json
+gsutil cp ${BUCKET}/seen_posts.json /app/seen_posts.json 2>/dev/null || touch /app/seen_posts.json
 
 echo "Downloading cookies from GCS (if exists)..."
 gsutil cp ${BUCKET}/cookies.json /app/cookies.json 2>/dev/null || true